@@ -16,15 +16,20 @@ Generates ALL DEM-derived rasters for archaeological predictive modelling:
     - twi.tif               : Topographic Wetness Index — ln(a / tan(β))
 
 All outputs preserve the input CRS (ESRI:102033), resolution (30 m), extent and
-NoData convention. Existing outputs are skipped unless --force is passed.
+NoData convention, and carry internal overviews (1/2 … 1/32) for fast previews.
+Existing outputs are skipped unless --force is passed.
+
+The neighbourhood derivatives (slope, TRI, aspect, curvature, TPI) are computed
+together in a single block-wise pass, so the DEM is read and decompressed once
+for all of them instead of once per variable.
 
 Requires:
     - GDAL >= 3.4
     - NumPy
     - SciPy (ndimage)
-    - tqdm
 
 References:
+    - Horn, B.K.P. (1981). Hill shading and the reflectance map (slope, aspect).
     - Riley, S.J., DeGloria, S.D., Elliot, R. (1999). A terrain ruggedness
       index that quantifies topographic heterogeneity.
     - Pulgar Vidal, J. (1987). Geografía del Perú: Las Ocho Regiones Naturales.
@@ -47,13 +52,24 @@ import os
 import argparse
 import logging
 import sys
+import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
 import numpy as np
 from osgeo import gdal
-from tqdm import tqdm
 
 gdal.UseExceptions()
 
+# Large block cache so LZW tiles decoded by one derivative pass are still warm
+# for the next; skip the sibling-file directory scan on every open; and let
+# GDAL use all cores for (de)compression.
+gdal.SetConfigOption("GDAL_CACHEMAX", "2048")
+gdal.SetConfigOption("GDAL_DISABLE_READDIR_ON_OPEN", "EMPTY_DIR")
+gdal.SetConfigOption("GDAL_NUM_THREADS", "ALL_CPUS")
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -68,8 +84,25 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..
 DEFAULT_INPUT = os.path.join(PROJECT_ROOT, "data", "processed", "rasters", "dem.tif")
 DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "data", "processed", "rasters")
 
-GTIFF_OPTIONS = ["COMPRESS=LZW", "TILED=YES", "PREDICTOR=2", "BIGTIFF=YES"]
+# PREDICTOR is added per data type by _gtiff_options().
+OUTPUT_BLOCK = 256  # output tile edge; block strips are a multiple of it
+GTIFF_OPTIONS = [
+    "COMPRESS=LZW",
+    "TILED=YES",
+    f"BLOCKXSIZE={OUTPUT_BLOCK}",
+    f"BLOCKYSIZE={OUTPUT_BLOCK}",
+    "BIGTIFF=IF_SAFER",
+]
 NODATA = -9999.0
+BLOCK_ROWS = 1024  # rows per strip in block-wise processing
+PROGRESS_STEPS = (0.1, 0.5, 1.0)  # fractions at which progress is logged
+# Each sweep strip returns five full-width float32 arrays (~1 GB for the
+# national DEM), so the worker count is bounded by memory, not CPUs.
+DEFAULT_WORKERS = 4
+
+# Internal overviews added to every output so previews and coarse sampling
+# read a reduced level instead of decoding the full 30 m raster.
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
 
 # ---------------------------------------------------------------------------
 # Pisos ecológicos — Javier Pulgar Vidal (8 regiones naturales)
@@ -98,10 +131,31 @@ PISOS_SIMPLE = [
     ( 4800, 99999,  6),   # Janca
 ]
 
+# Lookup tables for a single-pass reclassification (PISOS_SIMPLE bands are
+# contiguous). searchsorted(..., side="right") on PISOS_EDGES gives 0 below
+# the first band, i for band i and N + 1 above the last; PISOS_LUT maps
+# that index to the class code, with 0 (unclassified) at both ends.
+PISOS_EDGES = np.array([lo for lo, _, _ in PISOS_SIMPLE] + [PISOS_SIMPLE[-1][1]], dtype=np.float32)
+PISOS_LUT = np.array([0] + [code for _, _, code in PISOS_SIMPLE] + [0], dtype=np.uint8)
+
 
 # ===================================================================
 # Helpers
 # ===================================================================
+def _gtiff_options(dtype=gdal.GDT_Float32) -> list[str]:
+    """GeoTIFF creation options for *dtype*.
+
+    Float rasters use the floating-point predictor (PREDICTOR=3), integer
+    rasters horizontal differencing (PREDICTOR=2). 8-bit categorical codes
+    gain nothing from either, so Byte outputs use no predictor.
+    """
+    if dtype == gdal.GDT_Byte:
+        return list(GTIFF_OPTIONS)
+    if dtype in (gdal.GDT_Float32, gdal.GDT_Float64):
+        return GTIFF_OPTIONS + ["PREDICTOR=3"]
+    return GTIFF_OPTIONS + ["PREDICTOR=2"]
+
+
 def _write_raster(
     data: np.ndarray,
     reference_ds: gdal.Dataset,
@@ -117,7 +171,7 @@ def _write_raster(
         reference_ds.RasterYSize,
         1,
         dtype,
-        options=GTIFF_OPTIONS,
+        options=_gtiff_options(dtype),
     )
     out_ds.SetGeoTransform(reference_ds.GetGeoTransform())
     out_ds.SetProjection(reference_ds.GetProjection())
@@ -129,6 +183,162 @@ def _write_raster(
     logger.info("Saved → %s", output_path)
 
 
+def _open_raster(path: str) -> gdal.Dataset:
+    """
+    Open *path* read-only with multi-threaded GeoTIFF decoding.
+
+    NUM_THREADS follows GDAL_NUM_THREADS, so worker processes keep the
+    share of cores ``_init_worker`` gave them.
+    """
+    threads = gdal.GetConfigOption("GDAL_NUM_THREADS", "ALL_CPUS")
+    return gdal.OpenEx(path, gdal.OF_RASTER | gdal.OF_READONLY,
+                       open_options=[f"NUM_THREADS={threads}"])
+
+
+def _build_overviews(path: str, resampling: str = "AVERAGE") -> None:
+    """Add internal overviews (``OVERVIEW_LEVELS``) to a finished GeoTIFF.
+
+    The outputs are written block by block, which the COG driver cannot do
+    (it only supports CreateCopy). Adding the pyramid to the tiled GeoTIFF
+    afterwards gives readers the same overview levels without rewriting
+    the file. Use ``NEAREST`` for categorical or circular data.
+    """
+    ds = gdal.Open(path, gdal.GA_Update)
+    ds.BuildOverviews(resampling, OVERVIEW_LEVELS)
+    ds = None
+
+
+def _create_output(
+    reference_ds: gdal.Dataset,
+    output_path: str,
+    dtype=gdal.GDT_Float32,
+    nodata: float = NODATA,
+) -> tuple[gdal.Dataset, gdal.Band]:
+    """Create an empty GeoTIFF aligned with *reference_ds* for block-wise writing."""
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = driver.Create(
+        output_path,
+        reference_ds.RasterXSize,
+        reference_ds.RasterYSize,
+        1,
+        dtype,
+        options=_gtiff_options(dtype),
+    )
+    out_ds.SetGeoTransform(reference_ds.GetGeoTransform())
+    out_ds.SetProjection(reference_ds.GetProjection())
+    out_band = out_ds.GetRasterBand(1)
+    out_band.SetNoDataValue(nodata)
+    return out_ds, out_band
+
+
+def iter_blocks(
+    ds: gdal.Dataset,
+    block_rows: int = BLOCK_ROWS,
+    halo: int = 0,
+    desc: str | None = None,
+    bands: tuple[int, ...] = (1,),
+):
+    """
+    Read *bands* of *ds* (band 1 by default) as full-width strips of *block_rows* rows.
+
+    Yields ``(y_off, win_h, data)``: the strip covers rows ``y_off`` to
+    ``y_off + win_h`` and *data* adds up to *halo* rows above and below it,
+    clipped at the raster edges (so *data* starts at row
+    ``max(0, y_off - halo)``). The next strip is read on a background
+    thread while the caller processes the current one. Strips are read
+    into two buffers allocated once and used alternately, so memory stays
+    at two strips whatever the raster size, and *data* is only valid until
+    the next iteration. If *desc* is given, progress is logged under that
+    name.
+
+    With several *bands* (e.g. a stacked VRT), *data* is a tuple with one
+    array per band, each in that band's own data type.
+
+    *block_rows* is rounded up to a multiple of both the band's natural
+    block height and ``OUTPUT_BLOCK``. Strips then start on tile boundaries
+    of the input, so no tile is decoded for two strips (halo rows excepted;
+    those are usually still in the block cache), and of the outputs, so
+    every write covers whole tiles and none is LZW-encoded twice.
+    """
+    band_objs = [ds.GetRasterBand(b) for b in bands]
+    rows = ds.RasterYSize
+    block_rows = _aligned_block_rows(band_objs[0], block_rows)
+    offsets = range(0, rows, block_rows)
+    progress = _progress(desc) if desc is not None else None
+    buffers = None
+
+    def read(y_off, bufs=None):
+        win_h = min(block_rows, rows - y_off)
+        return [
+            _read_strip(band, y_off, win_h, halo, bufs[k] if bufs else None)
+            for k, band in enumerate(band_objs)
+        ]
+
+    # Only the reader thread touches *ds* while the generator runs. Strip i + 1
+    # is read into the buffers strip i - 1 used, which the caller is done with.
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = reader.submit(read, offsets[0]) if offsets else None
+        for i, y_off in enumerate(offsets):
+            data = pending.result()
+            if buffers is None:  # dtypes are known after the first read
+                shape = (min(block_rows + 2 * halo, rows), ds.RasterXSize)
+                buffers = [[np.empty(shape, a.dtype) for a in data] for _ in range(2)]
+            if i + 1 < len(offsets):
+                pending = reader.submit(read, offsets[i + 1], buffers[(i + 1) % 2])
+            yield y_off, min(block_rows, rows - y_off), data[0] if len(data) == 1 else tuple(data)
+            if progress is not None:
+                progress((i + 1) / len(offsets))
+
+
+def _aligned_block_rows(band: gdal.Band, block_rows: int = BLOCK_ROWS) -> int:
+    """Round *block_rows* up to a multiple of the input and output tile heights."""
+    step = math.lcm(max(1, band.GetBlockSize()[1]), OUTPUT_BLOCK)
+    if step > 4 * block_rows:
+        # Odd input tile height (e.g. 300 → lcm 19200): keep strips small and
+        # aligned to the output tiles only; straddled input tiles stay cached.
+        step = OUTPUT_BLOCK
+    return -(-block_rows // step) * step
+
+
+def _read_strip(
+    band: gdal.Band, y_off: int, win_h: int, halo: int, buf: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Read rows ``y_off`` to ``y_off + win_h`` plus up to *halo* rows on each side.
+
+    If *buf* is given, the strip is read into its leading rows and that
+    view is returned; otherwise a new array is allocated.
+    """
+    y_start = max(y_off - halo, 0)
+    y_end = min(y_off + win_h + halo, band.YSize)
+    if buf is None:
+        return band.ReadAsArray(0, y_start, band.XSize, y_end - y_start)
+    return band.ReadAsArray(0, y_start, band.XSize, y_end - y_start, buf_obj=buf[:y_end - y_start])
+
+
+@contextmanager
+def _write_behind(max_pending: int = 8):
+    """
+    Run ``band.WriteArray(data, 0, y_off)`` calls on a background thread.
+
+    Yields ``write(band, data, y_off)``. Compression and disk writes then
+    overlap with computing the next block. *data* must not be modified
+    after it is queued. At most *max_pending* writes are queued, and all
+    of them have finished (errors re-raised) when the block exits.
+    """
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        pending = deque()
+
+        def write(band, data, y_off):
+            while len(pending) >= max_pending:
+                pending.popleft().result()
+            pending.append(writer.submit(band.WriteArray, data, 0, y_off))
+
+        yield write
+        while pending:
+            pending.popleft().result()
+
+
 def _skip_or_compute(path: str, force: bool) -> bool:
     """Return True if the output already exists and force is False (skip)."""
     if os.path.isfile(path) and not force:
@@ -137,260 +347,370 @@ def _skip_or_compute(path: str, force: bool) -> bool:
     return False
 
 
-def _gdal_progress(name: str):
-    """Return a GDAL-compatible progress callback with tqdm bar."""
-    pbar = tqdm(
-        total=100, desc=f"  {name}", unit="%",
-        bar_format="{l_bar}{bar}| {n:.0f}/{total:.0f}% [{elapsed}<{remaining}]",
-    )
-    prev = [0.0]
-
-    def callback(complete, message, data):
-        pct = int(complete * 100)
-        delta = pct - prev[0]
-        if delta > 0:
-            pbar.update(delta)
-            prev[0] = pct
-        if complete >= 1.0:
-            pbar.close()
+def _progress(name: str):
+    """
+    Return a progress callback that logs *name* at each of ``PROGRESS_STEPS``.
+
+    The signature matches GDAL's ``callback(complete, message, data)`` and
+    also accepts a bare fraction. Plain log lines replace per-stage tqdm
+    bars, which garble each other when stages run in parallel workers and
+    redraw constantly when stdout is a log file.
+    """
+    pending = list(PROGRESS_STEPS)
+
+    def callback(complete, message=None, data=None):
+        while pending and complete >= pending[0]:
+            logger.info("  %s: %d%%", name, round(pending.pop(0) * 100))
         return 1
 
     return callback
 
 
 # ===================================================================
-# 1. PENDIENTE (slope)
+# 1. DERIVADAS DE VECINDAD — pendiente, rugosidad, aspecto, curvatura, TPI
 # ===================================================================
-def compute_pendiente(dem_ds: gdal.Dataset, output_path: str) -> None:
-    """Compute slope in degrees from a DEM raster."""
-    logger.info("Computing: pendiente (slope)")
-    gdal.DEMProcessing(
-        output_path,
-        dem_ds,
-        "slope",
-        format="GTiff",
-        slopeFormat="degree",
-        creationOptions=GTIFF_OPTIONS,
-        callback=_gdal_progress("pendiente"),
-    )
-    logger.info("Saved → %s", output_path)
+SWEEP_VARIABLES = ("pendiente", "rugosidad", "aspecto", "curvatura", "tpi")
 
 
-# ===================================================================
-# 2. RUGOSIDAD (TRI — Terrain Ruggedness Index)
-# ===================================================================
-def compute_rugosidad(dem_ds: gdal.Dataset, output_path: str) -> None:
-    """Compute Terrain Ruggedness Index (TRI) from a DEM raster."""
-    logger.info("Computing: rugosidad (TRI)")
-    gdal.DEMProcessing(
-        output_path,
-        dem_ds,
-        "TRI",
-        format="GTiff",
-        creationOptions=GTIFF_OPTIONS,
-        callback=_gdal_progress("rugosidad"),
-    )
-    logger.info("Saved → %s", output_path)
+def _neighbour(elev: np.ndarray, halo: int, dy: int, dx: int) -> np.ndarray:
+    """View of the halo-padded *elev* shifted by (dy, dx) over the block interior."""
+    rows = elev.shape[0] - 2 * halo
+    cols = elev.shape[1] - 2 * halo
+    return elev[halo + dy:halo + dy + rows, halo + dx:halo + dx + cols]
 
 
-# ===================================================================
-# 3. ALTITUD
-# ===================================================================
-def compute_altitud(dem_ds: gdal.Dataset, output_path: str) -> None:
-    """Copy DEM as altitud.tif with LZW compression."""
-    logger.info("Computing: altitud")
-    gdal.Translate(
-        output_path,
-        dem_ds,
-        format="GTiff",
-        creationOptions=GTIFF_OPTIONS,
-    )
-    logger.info("Saved → %s", output_path)
-
+def _slope_aspect(elev: np.ndarray, halo: int, cell_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Slope (degrees) and aspect (azimuth 0-360°, north=0) with Horn's method.
 
-# ===================================================================
-# 4. PISOS ECOLÓGICOS
-# ===================================================================
-def compute_pisos(dem_ds: gdal.Dataset, output_path: str) -> None:
-    """Reclassify elevation into Pulgar Vidal's natural regions."""
-    logger.info("Computing: pisos_ecologicos")
-    band = dem_ds.GetRasterBand(1)
-    rows = dem_ds.RasterYSize
-    block_size = 1024
+    Same formulation as ``gdaldem slope`` and ``gdaldem aspect -zero_for_flat``.
+    """
+    def n(dy, dx):
+        return _neighbour(elev, halo, dy, dx)
+
+    dz_dx = (n(-1, 1) + 2 * n(0, 1) + n(1, 1)) - (n(-1, -1) + 2 * n(0, -1) + n(1, -1))
+    dz_dy = (n(1, -1) + 2 * n(1, 0) + n(1, 1)) - (n(-1, -1) + 2 * n(-1, 0) + n(-1, 1))
+
+    slope = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy) / (8.0 * cell_size)))
+
+    aspect = np.degrees(np.arctan2(dz_dy, -dz_dx))
+    np.subtract(90.0, aspect, out=aspect)  # math angle → azimuth, in place
+    aspect[aspect < 0.0] += 360.0
+    aspect[aspect == 360.0] = 0.0
+    aspect[(dz_dx == 0) & (dz_dy == 0)] = 0.0
+    return slope, aspect
+
+
+def _tri(elev: np.ndarray, halo: int) -> np.ndarray:
+    """Terrain Ruggedness Index (Riley et al., 1999), as in ``gdaldem TRI``."""
+    centre = _neighbour(elev, halo, 0, 0)
+    total = np.zeros_like(centre)
+    diff = np.empty_like(centre)  # reused scratch buffer, no per-neighbour temporaries
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy or dx:
+                np.subtract(_neighbour(elev, halo, dy, dx), centre, out=diff)
+                np.multiply(diff, diff, out=diff)
+                total += diff
+    return np.sqrt(total, out=total)
+
+
+def _curvature(elev: np.ndarray, halo: int, cell_size: float) -> np.ndarray:
+    """Laplacian of the DEM (second derivative of elevation)."""
+    # 5-point stencil accumulated in place: one output buffer instead of a
+    # temporary per term. NaN (NoData) taps propagate to the result.
+    laplacian = np.add(_neighbour(elev, halo, -1, 0), _neighbour(elev, halo, 1, 0))
+    laplacian += _neighbour(elev, halo, 0, -1)
+    laplacian += _neighbour(elev, halo, 0, 1)
+    laplacian -= 4.0 * _neighbour(elev, halo, 0, 0)
+    laplacian *= 1.0 / cell_size ** 2
+    return laplacian
+
+
+def _tpi(elev: np.ndarray, halo: int, radius: int) -> np.ndarray:
+    """
+    Elevation minus the mean of the (2r+1)² window around each cell, centre excluded.
 
-    driver = gdal.GetDriverByName("GTiff")
-    out_ds = driver.Create(
-        output_path,
-        dem_ds.RasterXSize,
-        rows,
-        1,
-        gdal.GDT_Byte,
-        options=GTIFF_OPTIONS,
-    )
-    out_ds.SetGeoTransform(dem_ds.GetGeoTransform())
-    out_ds.SetProjection(dem_ds.GetProjection())
-    out_band = out_ds.GetRasterBand(1)
-    out_band.SetNoDataValue(0)
+    The window mean comes from ``uniform_filter``, which is separable
+    (two 1-D passes, O(r) per cell instead of O(r²) for a dense 2-D
+    kernel). The centre cell is then removed from the window sum.
 
-    n_blocks = (rows + block_size - 1) // block_size
-    for y_off in tqdm(range(0, rows, block_size), total=n_blocks, desc="  pisos", unit="blk"):
-        win_h = min(block_size, rows - y_off)
-        elev = band.ReadAsArray(0, y_off, dem_ds.RasterXSize, win_h).astype(np.float32)
-        result = np.zeros_like(elev, dtype=np.uint8)
+    ``uniform_filter`` keeps running sums, so a NaN would poison the rest
+    of its row; NoData is filtered as zeros instead, and cells whose
+    window contains any NoData are set back to NaN.
+    """
+    from scipy.ndimage import uniform_filter
+
+    size = 2 * radius + 1
+    n = size * size
+    nodata = np.isnan(elev)
+    filled = np.where(nodata, 0.0, elev)
+    centre = _neighbour(elev, halo, 0, 0)
+    window_sum = _neighbour(uniform_filter(filled, size=size, mode="nearest"), halo, 0, 0) * n
+    tpi = centre - (window_sum - centre) / (n - 1)
+    if nodata.any():
+        touched = uniform_filter(nodata.astype(np.float32), size=size, mode="nearest")
+        tpi[_neighbour(touched, halo, 0, 0) > 0.5 / n] = np.nan
+    return tpi
+
+
+def _sweep_block(
+    data: np.ndarray,
+    y_off: int,
+    win_h: int,
+    halo: int,
+    cell_size: float,
+    names: tuple[str, ...],
+    tpi_radius: int,
+) -> dict[str, np.ndarray]:
+    """Derive *names* for one strip read by ``_read_strip``; float32, NoData filled."""
+    top = min(halo, y_off)
+    if not np.any(data[top:top + win_h] != NODATA):
+        # Every output is NoData wherever the centre cell is NoData (enforced
+        # by the fill loop below), so strips wholly outside the country mask
+        # can skip the stencils with the same result.
+        empty = np.full((win_h, data.shape[1]), NODATA, dtype=np.float32)
+        return {name: empty for name in names}
+
+    elev = data.astype(np.float32)
+    elev[elev == NODATA] = np.nan
+    bottom = elev.shape[0] - top - win_h
+    elev = np.pad(elev, ((halo - top, halo - bottom), (halo, halo)), mode="edge")
+
+    results = {}
+    if "pendiente" in names or "aspecto" in names:
+        results["pendiente"], results["aspecto"] = _slope_aspect(elev, halo, cell_size)
+    if "rugosidad" in names:
+        results["rugosidad"] = _tri(elev, halo)
+    if "curvatura" in names:
+        results["curvatura"] = _curvature(elev, halo, cell_size)
+    if "tpi" in names:
+        results["tpi"] = _tpi(elev, halo, tpi_radius)
+
+    # Horn's stencil never reads the centre, so a NoData cell ringed by
+    # valid ones would get a slope; gdaldem writes NoData there, as here
+    # for every variable.
+    centre_nodata = np.isnan(_neighbour(elev, halo, 0, 0))
+    out = {}
+    for name in names:
+        result = results[name]
+        result[centre_nodata | ~np.isfinite(result)] = NODATA
+        out[name] = result.astype(np.float32, copy=False)
+    return out
+
+
+def _sweep_strip(dem_path: str, y_off: int, win_h: int, halo: int, *args) -> dict[str, np.ndarray]:
+    """Worker-process entry: open the DEM, read one strip and run ``_sweep_block``."""
+    dem_ds = _open_raster(dem_path)
+    data = _read_strip(dem_ds.GetRasterBand(1), y_off, win_h, halo)
+    dem_ds = None
+    return _sweep_block(data, y_off, win_h, halo, *args)
 
-        for lo, hi, code in PISOS_SIMPLE:
-            mask = (elev >= lo) & (elev < hi) & (elev != NODATA)
-            result[mask] = code
 
-        result[elev == NODATA] = 0
-        out_band.WriteArray(result, 0, y_off)
+def _sweep_blocks(dem_ds: gdal.Dataset, halo: int, args: tuple, workers: int):
+    """
+    Yield ``(y_off, results)`` for every strip of the DEM, in any order.
 
-    out_band.FlushCache()
-    out_ds = None
-    logger.info("Saved → %s", output_path)
+    With one worker the strips are computed here, from ``iter_blocks``.
+    Otherwise they are spread over *workers* processes, each opening the
+    DEM by path; at most ``workers + 1`` strips are in flight (one per
+    worker plus one finished result being written), so memory stays at a
+    few strips rather than growing with the number of workers.
+    """
+    if workers <= 1:
+        for y_off, win_h, data in iter_blocks(dem_ds, halo=halo, desc="sweep"):
+            yield y_off, _sweep_block(data, y_off, win_h, halo, *args)
+        return
 
+    dem_path = dem_ds.GetDescription()
+    rows = dem_ds.RasterYSize
+    block_rows = _aligned_block_rows(dem_ds.GetRasterBand(1))
+    offsets = iter(range(0, rows, block_rows))
+    n_blocks = (rows + block_rows - 1) // block_rows
+    progress = _progress("sweep")
+    cpus = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=_MP_CONTEXT,
+        initializer=_init_worker,
+        initargs=(max(1, cpus // workers), max(256, 2048 // workers)),
+    ) as pool:
+        def submit(y_off):
+            win_h = min(block_rows, rows - y_off)
+            return pool.submit(_sweep_strip, dem_path, y_off, win_h, halo, *args)
+
+        pending = {}
+        for y_off in offsets:
+            pending[submit(y_off)] = y_off
+            if len(pending) >= workers + 1:
+                break
+        done_count = 0
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                y_off = pending.pop(future)
+                next_off = next(offsets, None)
+                if next_off is not None:
+                    pending[submit(next_off)] = next_off
+                yield y_off, future.result()
+                done_count += 1
+                progress(done_count / n_blocks)
+
+
+def compute_terrain_sweep(
+    dem_ds: gdal.Dataset,
+    outputs: dict[str, str],
+    tpi_radius: int = 10,
+    workers: int = 1,
+) -> None:
+    """
+    Compute the neighbourhood derivatives of the DEM in a single pass.
 
-# ===================================================================
-# 5. ASPECTO (orientación solar)
-# ===================================================================
-def compute_aspecto(dem_ds: gdal.Dataset, output_path: str) -> None:
-    """Compute slope aspect (azimuth 0-360°) using GDAL DEMProcessing."""
-    logger.info("Computing: aspecto")
-    gdal.DEMProcessing(
-        output_path,
-        dem_ds,
-        "aspect",
-        format="GTiff",
-        creationOptions=GTIFF_OPTIONS,
-        zeroForFlat=True,
-        callback=_gdal_progress("aspecto"),
-    )
-    logger.info("Saved → %s", output_path)
+    Each block of rows is read once, with a halo wide enough for the
+    largest kernel, and every requested variable is derived from that
+    same buffer. Running slope, TRI, aspect, curvature and TPI as
+    separate passes decoded every LZW tile of the DEM five times.
 
+    Parameters
+    ----------
+    outputs : dict
+        Maps a subset of ``SWEEP_VARIABLES`` to its output path.
+    tpi_radius : int
+        Half-width in pixels of the square TPI window, (2r+1)² cells
+        (default 10 → 21 × 21 cells, 630 m across at 30 m).
+    workers : int
+        Processes computing blocks in parallel. Workers only compute; this
+        process writes every output, so no GeoTIFF is written concurrently.
+
+    Notes
+    -----
+    Cells whose neighbourhood touches NoData are written as NoData. At the
+    raster border the DEM is extended by edge replication.
+    """
+    unknown = set(outputs) - set(SWEEP_VARIABLES)
+    if unknown:
+        raise ValueError(f"Not a sweep variable: {sorted(unknown)}")
 
-# ===================================================================
-# 6. CURVATURA (profile curvature)
-# ===================================================================
-def compute_curvatura(dem_ds: gdal.Dataset, output_path: str) -> None:
-    """Compute profile curvature as the Laplacian of the DEM (second derivative)."""
-    logger.info("Computing: curvatura")
-    from scipy.ndimage import convolve
+    names = tuple(name for name in SWEEP_VARIABLES if name in outputs)
+    logger.info("Computing: %s (single pass, %d worker(s))", ", ".join(names), workers)
+    if "tpi" in outputs:
+        size = 2 * tpi_radius + 1
+        logger.info("  TPI window = %d × %d px (half-width %d px)", size, size, tpi_radius)
 
-    band = dem_ds.GetRasterBand(1)
-    rows = dem_ds.RasterYSize
-    cols = dem_ds.RasterXSize
-    gt = dem_ds.GetGeoTransform()
-    cell_size = abs(gt[1])  # 30 m
+    cell_size = abs(dem_ds.GetGeoTransform()[1])  # 30 m
+    halo = max(1, tpi_radius) if "tpi" in outputs else 1
 
-    driver = gdal.GetDriverByName("GTiff")
-    out_ds = driver.Create(
-        output_path, cols, rows, 1, gdal.GDT_Float32, options=GTIFF_OPTIONS
-    )
-    out_ds.SetGeoTransform(gt)
-    out_ds.SetProjection(dem_ds.GetProjection())
-    out_band = out_ds.GetRasterBand(1)
-    out_band.SetNoDataValue(NODATA)
+    targets = {name: _create_output(dem_ds, outputs[name]) for name in names}
 
-    kernel = np.array([[0, 1, 0],
-                       [1, -4, 1],
-                       [0, 1, 0]], dtype=np.float64) / (cell_size ** 2)
+    with _write_behind() as write:
+        for y_off, results in _sweep_blocks(dem_ds, halo, (cell_size, names, tpi_radius), workers):
+            for name, (out_ds, out_band) in targets.items():
+                write(out_band, results[name], y_off)
 
-    block = 1024
-    n_blocks = (rows + block - 1) // block
-    for y_off in tqdm(range(0, rows, block), total=n_blocks, desc="  curvatura", unit="blk"):
-        y_start = max(y_off - 1, 0)
-        y_end = min(y_off + block + 1, rows)
-        elev = band.ReadAsArray(0, y_start, cols, y_end - y_start).astype(np.float64)
+    for out_ds, out_band in targets.values():
+        out_band.FlushCache()
+    # A band keeps its dataset open: drop every handle (including the loop
+    # variables) so _build_overviews does not write a file that is still open.
+    out_ds = out_band = targets = None
 
-        nodata_mask = (elev == NODATA)
-        elev[nodata_mask] = np.nan
+    for name, path in outputs.items():
+        # Averaging azimuths across the 0/360 seam is meaningless.
+        _build_overviews(path, "NEAREST" if name == "aspecto" else "AVERAGE")
+        logger.info("Saved → %s", path)
 
-        curv = convolve(elev, kernel, mode="nearest")
 
-        trim_top = y_off - y_start
-        trim_bot = y_end - min(y_off + block, rows)
-        if trim_bot > 0:
-            curv = curv[trim_top:-trim_bot]
+# ===================================================================
+# 2. ALTITUD
+# ===================================================================
+def compute_altitud(dem_ds: gdal.Dataset, output_path: str, int16: bool = False) -> None:
+    """
+    Copy DEM as altitud.tif with LZW compression.
+
+    With *int16*, a Float32/Float64 DEM whose range fits in Int16 is stored
+    as Int16, halving the bytes every later read of altitud.tif has to
+    decode. GDAL rounds values to the nearest whole metre (and clamps to
+    the Int16 range), so only request it for a DEM that holds whole metres
+    (ASTER/SRTM, not a resampled mosaic). The range check uses approximate
+    statistics (overviews or a sample), not a full scan. Otherwise the DEM keeps its type.
+    """
+    logger.info("Computing: altitud")
+    band = dem_ds.GetRasterBand(1)
+    dtype = band.DataType
+    if int16 and dtype in (gdal.GDT_Float32, gdal.GDT_Float64):
+        lo, hi = band.ComputeRasterMinMax(True)
+        nodata = band.GetNoDataValue()
+        info = np.iinfo(np.int16)
+        if info.min <= lo and hi <= info.max and (nodata is None or info.min <= nodata <= info.max):
+            dtype = gdal.GDT_Int16
+            logger.info("  Float DEM range [%.0f, %.0f] fits Int16; storing as Int16", lo, hi)
         else:
-            curv = curv[trim_top:]
-
-        nodata_out = np.isnan(curv)
-        curv[nodata_out] = NODATA
-        out_band.WriteArray(curv.astype(np.float32), 0, y_off)
-
-    out_band.FlushCache()
-    out_ds = None
+            logger.info("  Float DEM range [%.0f, %.0f] does not fit Int16; keeping type", lo, hi)
+    gdal.Translate(
+        output_path,
+        dem_ds,
+        format="GTiff",
+        outputType=dtype,
+        creationOptions=_gtiff_options(dtype),
+        callback=_progress("altitud"),
+    )
+    _build_overviews(output_path)
     logger.info("Saved → %s", output_path)
 
 
 # ===================================================================
-# 7. TPI — Topographic Position Index
+# 3. PISOS ECOLÓGICOS
 # ===================================================================
-def compute_tpi(dem_ds: gdal.Dataset, output_path: str, radius: int = 10) -> None:
-    """
-    Compute TPI = elevation - mean(elevation in annular neighbourhood).
+def _pisos_edges(dtype: np.dtype) -> np.ndarray:
+    """``PISOS_EDGES`` in *dtype*, so searchsorted compares without upcasting.
 
-    Parameters
-    ----------
-    radius : int
-        Radius in pixels for the neighbourhood ring (default 10 → 300 m).
+    For integer types, edges above the type's maximum can never be reached
+    and are dropped (99999 does not fit in Int16).
     """
-    logger.info("Computing: TPI (radius=%d px = %d m)", radius, radius * 30)
-    from scipy.ndimage import convolve
+    if np.issubdtype(dtype, np.integer):
+        return PISOS_EDGES[PISOS_EDGES <= np.iinfo(dtype).max].astype(dtype)
+    return PISOS_EDGES.astype(dtype)
 
-    band = dem_ds.GetRasterBand(1)
-    rows = dem_ds.RasterYSize
-    cols = dem_ds.RasterXSize
 
-    # Build annular kernel
-    y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
-    dist = np.sqrt(x ** 2 + y ** 2)
-    kernel = ((dist <= radius) & (dist > 0)).astype(np.float64)
-    kernel /= kernel.sum()
+def _pisos_int16_lut() -> np.ndarray:
+    """Class code for every Int16 value, indexed by its raw bits (``elev.view(np.uint16)``)."""
+    values = np.arange(1 << 16, dtype=np.uint16).view(np.int16)
+    lut = PISOS_LUT[np.searchsorted(_pisos_edges(values.dtype), values, side="right")]
+    lut[values == NODATA] = 0
+    return lut
 
-    driver = gdal.GetDriverByName("GTiff")
-    out_ds = driver.Create(
-        output_path, cols, rows, 1, gdal.GDT_Float32, options=GTIFF_OPTIONS
-    )
-    out_ds.SetGeoTransform(dem_ds.GetGeoTransform())
-    out_ds.SetProjection(dem_ds.GetProjection())
-    out_band = out_ds.GetRasterBand(1)
-    out_band.SetNoDataValue(NODATA)
-
-    block = 1024
-    pad = radius
-    n_blocks = (rows + block - 1) // block
-    for y_off in tqdm(range(0, rows, block), total=n_blocks, desc="  TPI", unit="blk"):
-        y_start = max(y_off - pad, 0)
-        y_end = min(y_off + block + pad, rows)
-        elev = band.ReadAsArray(0, y_start, cols, y_end - y_start).astype(np.float64)
-
-        nodata_mask = (elev == NODATA)
-        elev[nodata_mask] = np.nan
-
-        mean_elev = convolve(elev, kernel, mode="nearest")
-        tpi = elev - mean_elev
-
-        trim_top = y_off - y_start
-        trim_bot = y_end - min(y_off + block, rows)
-        if trim_bot > 0:
-            tpi = tpi[trim_top:-trim_bot]
-            nodata_mask = nodata_mask[trim_top:-trim_bot]
-        else:
-            tpi = tpi[trim_top:]
-            nodata_mask = nodata_mask[trim_top:]
 
-        tpi[nodata_mask] = NODATA
-        tpi_clean = np.where(np.isnan(tpi), NODATA, tpi)
-        out_band.WriteArray(tpi_clean.astype(np.float32), 0, y_off)
+def compute_pisos(dem_ds: gdal.Dataset, output_path: str) -> None:
+    """Reclassify elevation into Pulgar Vidal's natural regions."""
+    logger.info("Computing: pisos_ecologicos")
+    out_ds, out_band = _create_output(dem_ds, output_path, gdal.GDT_Byte, nodata=0)
+
+    edges = lut = None
+    with _write_behind() as write:
+        # Thresholds are whole metres: compare in the DEM's native type
+        # (Int16 for ASTER) instead of a float32 copy of every block. An
+        # Int16 DEM skips the comparisons entirely: one gather per pixel from
+        # a 65536-entry table that already maps NODATA to 0.
+        for y_off, _, elev in iter_blocks(dem_ds, desc="pisos"):
+            if elev.dtype == np.int16:
+                if lut is None:
+                    lut = _pisos_int16_lut()
+                result = lut[elev.view(np.uint16)]
+            else:
+                if edges is None:
+                    edges = _pisos_edges(elev.dtype)
+                result = PISOS_LUT[np.searchsorted(edges, elev, side="right")]
+                result[elev == NODATA] = 0
+            write(out_band, result, y_off)
 
     out_band.FlushCache()
-    out_ds = None
+    out_band = out_ds = None  # close before _build_overviews reopens it
+    _build_overviews(output_path, "NEAREST")
     logger.info("Saved → %s", output_path)
 
 
 # ===================================================================
-# 8. TWI — Topographic Wetness Index
+# 4. TWI — Topographic Wetness Index
 # ===================================================================
 def compute_twi(dem_ds: gdal.Dataset, slope_path: str, output_path: str) -> None:
     """
@@ -404,53 +724,76 @@ def compute_twi(dem_ds: gdal.Dataset, slope_path: str, output_path: str) -> None
     would be preferable.
     """
     logger.info("Computing: TWI (simplified)")
-    band = dem_ds.GetRasterBand(1)
-    rows = dem_ds.RasterYSize
-    cols = dem_ds.RasterXSize
     gt = dem_ds.GetGeoTransform()
     cell_size = abs(gt[1])
 
-    slope_ds = gdal.Open(slope_path)
-    if slope_ds is None:
+    if not os.path.exists(slope_path):
         raise FileNotFoundError(
             f"Slope raster not found: {slope_path}. "
             "Run this script first without --force to generate pendiente.tif."
         )
+    slope_ds = _open_raster(slope_path)
+
+    out_ds, out_band = _create_output(dem_ds, output_path)
+
+    # DEM and slope stacked as one in-memory VRT, so both strips are read
+    # together on iter_blocks' read-ahead thread. The VRT wraps the open
+    # handles (both opened with NUM_THREADS) instead of reopening by path.
+    stack_ds = gdal.BuildVRT("", [dem_ds, slope_ds], separate=True)
+
+    sca = cell_size
+    min_slope = np.float32(np.deg2rad(0.1))
+
+    with _write_behind() as write:
+        for y_off, _, (elev, slope_deg) in iter_blocks(stack_ds, desc="TWI", bands=(1, 2)):
+            if not np.any(elev != NODATA):
+                write(out_band, np.full(elev.shape, NODATA, dtype=np.float32), y_off)
+                continue
+            # Every step writes into one float32 copy of the slope strip, so
+            # the block is streamed once instead of once per intermediate array.
+            twi = slope_deg.astype(np.float32)
+            np.deg2rad(twi, out=twi)
+            np.maximum(twi, min_slope, out=twi)
+            np.tan(twi, out=twi)
+            np.divide(sca, twi, out=twi)
+            np.log(twi, out=twi)
+
+            twi[(elev == NODATA) | ~np.isfinite(twi)] = NODATA
+            write(out_band, twi, y_off)
 
-    driver = gdal.GetDriverByName("GTiff")
-    out_ds = driver.Create(
-        output_path, cols, rows, 1, gdal.GDT_Float32, options=GTIFF_OPTIONS
-    )
-    out_ds.SetGeoTransform(gt)
-    out_ds.SetProjection(dem_ds.GetProjection())
-    out_band = out_ds.GetRasterBand(1)
-    out_band.SetNoDataValue(NODATA)
+    out_band.FlushCache()
+    stack_ds = None
+    slope_ds = None
+    out_band = out_ds = None  # close before _build_overviews reopens it
+    _build_overviews(output_path)
+    logger.info("Saved → %s", output_path)
 
-    slope_band = slope_ds.GetRasterBand(1)
 
-    block = 1024
-    n_blocks = (rows + block - 1) // block
-    for y_off in tqdm(range(0, rows, block), total=n_blocks, desc="  TWI", unit="blk"):
-        win_h = min(block, rows - y_off)
-        elev = band.ReadAsArray(0, y_off, cols, win_h).astype(np.float64)
-        slope_deg = slope_band.ReadAsArray(0, y_off, cols, win_h).astype(np.float64)
+# ===================================================================
+# Parallel execution
+# ===================================================================
+# Workers are spawned, not forked: the parent runs reader/writer threads, and
+# a fork taken while one of them holds a GDAL lock can deadlock the child.
+_MP_CONTEXT = multiprocessing.get_context("spawn")
 
-        nodata_mask = (elev == NODATA)
 
-        slope_rad = np.deg2rad(slope_deg)
-        slope_rad = np.clip(slope_rad, np.deg2rad(0.1), None)
+def _init_worker(gdal_threads: int, cache_mb: int) -> None:
+    """Split GDAL's thread count and block cache between worker processes."""
+    gdal.SetConfigOption("GDAL_NUM_THREADS", str(gdal_threads))
+    gdal.SetConfigOption("GDAL_CACHEMAX", str(cache_mb))
 
-        sca = cell_size
-        twi = np.log(sca / np.tan(slope_rad))
 
-        twi[nodata_mask] = NODATA
-        twi_clean = np.where(np.isnan(twi) | np.isinf(twi), NODATA, twi)
-        out_band.WriteArray(twi_clean.astype(np.float32), 0, y_off)
+def _run_on_dem(func, dem_path: str, *args, **kwargs) -> None:
+    """Open the DEM and run *func* on it.
 
-    out_band.FlushCache()
-    slope_ds = None
-    out_ds = None
-    logger.info("Saved → %s", output_path)
+    gdal.Dataset objects cannot be pickled, so worker processes receive
+    the DEM path and open their own handle.
+    """
+    dem_ds = _open_raster(dem_path)
+    try:
+        func(dem_ds, *args, **kwargs)
+    finally:
+        dem_ds = None
 
 
 # ===================================================================
@@ -475,12 +818,22 @@ def main() -> None:
     )
     parser.add_argument(
         "--tpi-radius", type=int, default=10,
-        help="TPI neighbourhood radius in pixels (default: 10 = 300 m).",
+        help="Half-width in pixels of the square TPI window (default: 10 = 21 × 21 cells).",
+    )
+    parser.add_argument(
+        "--altitud-int16", action="store_true",
+        help="Store altitud.tif as Int16 when the DEM holds whole metres (rounds decimals).",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=min(DEFAULT_WORKERS, os.cpu_count() or 1),
+        help=f"Worker processes for the neighbourhood sweep "
+             f"(default: {DEFAULT_WORKERS}, or the CPU count if lower). "
+             "Each in-flight strip holds ~1 GB of results for a national DEM.",
     )
     args = parser.parse_args()
 
     # Validate input
-    dem_ds = gdal.Open(args.input)
+    dem_ds = _open_raster(args.input)
     if dem_ds is None:
         logger.error("Cannot open DEM: %s", args.input)
         sys.exit(1)
@@ -501,67 +854,59 @@ def main() -> None:
         "twi":              os.path.join(args.output_dir, "twi.tif"),
     }
 
+    dem_ds = None  # each stage opens its own handle
+
     computed, skipped = 0, 0
 
-    # --- 1. Pendiente ---
-    if _skip_or_compute(outputs["pendiente"], args.force):
-        skipped += 1
-    else:
-        compute_pendiente(dem_ds, outputs["pendiente"])
-        computed += 1
+    # Altitud and pisos read only the DEM and do not depend on the sweep, so
+    # they run in their own processes while the sweep spreads its blocks over
+    # --workers processes. TWI needs pendiente.tif and runs last.
+    stages = []  # (func, args)
 
-    # --- 2. Rugosidad (TRI) ---
-    if _skip_or_compute(outputs["rugosidad"], args.force):
-        skipped += 1
-    else:
-        compute_rugosidad(dem_ds, outputs["rugosidad"])
-        computed += 1
+    # --- 1. Pendiente, rugosidad, aspecto, curvatura, TPI (one pass) ---
+    sweep_outputs = {}
+    for name in SWEEP_VARIABLES:
+        if _skip_or_compute(outputs[name], args.force):
+            skipped += 1
+        else:
+            sweep_outputs[name] = outputs[name]
 
-    # --- 3. Altitud ---
+    # --- 2. Altitud ---
     if _skip_or_compute(outputs["altitud"], args.force):
         skipped += 1
     else:
-        compute_altitud(dem_ds, outputs["altitud"])
-        computed += 1
+        stages.append((compute_altitud, (outputs["altitud"], args.altitud_int16)))
 
-    # --- 4. Pisos ecológicos ---
+    # --- 3. Pisos ecológicos ---
     if _skip_or_compute(outputs["pisos_ecologicos"], args.force):
         skipped += 1
     else:
-        compute_pisos(dem_ds, outputs["pisos_ecologicos"])
-        computed += 1
-
-    # --- 5. Aspecto ---
-    if _skip_or_compute(outputs["aspecto"], args.force):
-        skipped += 1
-    else:
-        compute_aspecto(dem_ds, outputs["aspecto"])
-        computed += 1
-
-    # --- 6. Curvatura ---
-    if _skip_or_compute(outputs["curvatura"], args.force):
-        skipped += 1
-    else:
-        compute_curvatura(dem_ds, outputs["curvatura"])
-        computed += 1
-
-    # --- 7. TPI ---
-    if _skip_or_compute(outputs["tpi"], args.force):
-        skipped += 1
-    else:
-        compute_tpi(dem_ds, outputs["tpi"], radius=args.tpi_radius)
-        computed += 1
-
-    # --- 8. TWI ---
+        stages.append((compute_pisos, (outputs["pisos_ecologicos"],)))
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, len(stages)),
+        mp_context=_MP_CONTEXT,
+        initializer=_init_worker,
+        initargs=(1, 256),
+    ) as pool:
+        futures = [pool.submit(_run_on_dem, func, args.input, *func_args)
+                   for func, func_args in stages]
+        if sweep_outputs:
+            _run_on_dem(compute_terrain_sweep, args.input, sweep_outputs,
+                        args.tpi_radius, workers=max(1, args.workers))
+            computed += len(sweep_outputs)
+        for future in futures:
+            future.result()
+    computed += len(stages)
+
+    # --- 4. TWI ---
     if _skip_or_compute(outputs["twi"], args.force):
         skipped += 1
     else:
         slope_path = os.path.join(args.output_dir, "pendiente.tif")
-        compute_twi(dem_ds, slope_path, outputs["twi"])
+        _run_on_dem(compute_twi, args.input, slope_path, outputs["twi"])
         computed += 1
 
-    dem_ds = None
-
     logger.info("=" * 60)
     logger.info("Done. Computed: %d | Skipped: %d | Total: %d", computed, skipped, computed + skipped)
     logger.info("=" * 60)
@@ -34,36 +34,26 @@ DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "data", "processed", "rasters")
 GTIFF_OPTIONS = ["COMPRESS=LZW", "TILED=YES", "PREDICTOR=2"]
 
 
-def compute_slope(input_path: str, output_path: str) -> None:
-    """Compute slope in degrees from a DEM raster."""
+def compute_slope(dem_ds: gdal.Dataset, output_path: str) -> None:
+    """Compute slope in degrees from an open DEM dataset."""
     logger.info("Computing slope: %s", output_path)
-    ds = gdal.Open(input_path)
-    if ds is None:
-        raise FileNotFoundError(f"Cannot open DEM: {input_path}")
-
     gdal.DEMProcessing(
-        output_path, ds, "slope",
+        output_path, dem_ds, "slope",
         format="GTiff",
         slopeFormat="degree",
         creationOptions=GTIFF_OPTIONS,
     )
-    ds = None
     logger.info("Slope saved: %s", output_path)
 
 
-def compute_tri(input_path: str, output_path: str) -> None:
-    """Compute Terrain Ruggedness Index (TRI) from a DEM raster."""
+def compute_tri(dem_ds: gdal.Dataset, output_path: str) -> None:
+    """Compute Terrain Ruggedness Index (TRI) from an open DEM dataset."""
     logger.info("Computing TRI: %s", output_path)
-    ds = gdal.Open(input_path)
-    if ds is None:
-        raise FileNotFoundError(f"Cannot open DEM: {input_path}")
-
     gdal.DEMProcessing(
-        output_path, ds, "TRI",
+        output_path, dem_ds, "TRI",
         format="GTiff",
         creationOptions=GTIFF_OPTIONS,
     )
-    ds = None
     logger.info("TRI saved: %s", output_path)
 
 
@@ -78,8 +68,14 @@ def main():
     slope_path = os.path.join(args.output_dir, "pendiente.tif")
     tri_path = os.path.join(args.output_dir, "rugosidad.tif")
 
-    compute_slope(args.input, slope_path)
-    compute_tri(args.input, tri_path)
+    # Open the DEM once and share the handle (and its block cache) between passes.
+    dem_ds = gdal.Open(args.input)
+    if dem_ds is None:
+        raise FileNotFoundError(f"Cannot open DEM: {args.input}")
+
+    compute_slope(dem_ds, slope_path)
+    compute_tri(dem_ds, tri_path)
+    dem_ds = None
 
     logger.info("All derivatives computed successfully.")
 
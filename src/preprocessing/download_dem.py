@@ -2,7 +2,8 @@
 
 Scrapes tile URLs from the GeoGPSPeru catalog (JavaScript-based index),
 converts Google Drive view links to direct download links, and saves
-each tile as a .zip archive.
+each tile as a .zip archive. Interrupted downloads are kept as .part
+files and resumed on the next run.
 
 Data source:
     GeoGPSPeru ASTER GDEM v3 catalog
@@ -16,11 +17,13 @@ Usage:
 import os
 import re
 import json
-import time
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
@@ -29,19 +32,29 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..
 DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "data", "raw", "dem_tiles")
 CATALOG_URL = "https://geogpsperu.github.io/dem.github.com/data/DEMASTER_3.js"
 
+MAX_WORKERS = 8          # Concurrent downloads (also caps load on the server)
+CHUNK_SIZE = 1 << 20     # 1 MiB per write
+
+TILE_LINK_RE = re.compile(r'"codigo":\s*"([^"]+)",\s*"descarga":\s*"(https:[^"]+)"')
+GDRIVE_ID_RE = re.compile(r"(?:id=|/file/d/)([^/&?]+)")
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-")
+_JSON_DECODER = json.JSONDecoder()
+
 
 def parse_js_catalog(js_text: str) -> dict | None:
     """Parse JavaScript variable assignment into a Python dict.
 
     The source file has the form: var json_DEMASTER_3 = { ... };
-    This function strips the variable declaration and trailing semicolon.
+    The object is decoded in place starting at the first brace, so the
+    catalog text is never sliced or copied and the trailing semicolon is
+    simply left unread.
     """
     try:
         start = js_text.find("{")
         if start == -1:
             return None
-        json_str = js_text[start:].strip().rstrip(";")
-        return json.loads(json_str)
+        catalog, _ = _JSON_DECODER.raw_decode(js_text, start)
+        return catalog
     except (json.JSONDecodeError, ValueError) as exc:
         logger.warning("JSON parsing failed (%s). Falling back to regex.", exc)
         return None
@@ -49,30 +62,105 @@ def parse_js_catalog(js_text: str) -> dict | None:
 
 def extract_links_regex(text: str) -> list[dict]:
     """Fallback: extract tile codes and download URLs via regex."""
-    pattern = r'"codigo":\s*"([^"]+)",\s*"descarga":\s*"(https:[^"]+)"'
-    matches = re.findall(pattern, text)
+    matches = TILE_LINK_RE.findall(text)
     return [{"properties": {"codigo": code, "descarga": url}} for code, url in matches]
 
 
 def gdrive_direct_url(url: str) -> str:
     """Convert a Google Drive view URL to a direct download URL."""
     url = url.replace("\\/", "/")
-    file_id = None
-    if "id=" in url:
-        file_id = url.split("id=")[1].split("&")[0]
-    elif "/file/d/" in url:
-        file_id = url.split("/file/d/")[1].split("/")[0]
-    if file_id:
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
+    match = GDRIVE_ID_RE.search(url)
+    if match:
+        return f"https://drive.google.com/uc?export=download&id={match.group(1)}"
     return url
 
 
-def download_tiles(output_dir: str) -> None:
-    """Download all ASTER GDEM tiles to the specified directory."""
+def make_session(pool_size: int = 16) -> requests.Session:
+    """Create a keep-alive session with a shared connection pool and retries."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=3, backoff_factor=1),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def download_tile(session: requests.Session, url: str, output_path: str, label: str) -> None:
+    """Stream a single tile to *output_path* using the shared session.
+
+    Data is written to ``<output_path>.part`` and renamed only once the
+    transfer completes. If a .part file is left over from an interrupted
+    run, the download resumes from its size with an HTTP Range request.
+    A partial response that does not start at that offset is discarded
+    and the tile is fetched again from the beginning.
+    """
+    part_path = output_path + ".part"
+    existing = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={existing}-"} if existing else None
+
+    logger.info("%s Downloading ...", label)
+    mode, restart = None, False
+    try:
+        with session.get(url, stream=True, timeout=60, headers=headers) as r:
+            if r.status_code == 206:
+                match = CONTENT_RANGE_RE.match(r.headers.get("Content-Range", ""))
+                start = int(match.group(1)) if match else None
+                if start != existing:
+                    # Appending a body that starts elsewhere would corrupt the tile.
+                    logger.warning("%s -- partial response starts at byte %s, not %d.",
+                                   label, start, existing)
+                    restart = existing > 0
+                else:
+                    logger.info("%s -- resuming from %d bytes.", label, existing)
+                    mode = "ab"
+            elif r.status_code == 200:
+                # Fresh download, or the server ignored the Range header.
+                mode = "wb"
+            elif r.status_code == 416 and existing:
+                # Range starts at the end of the file: the .part is already
+                # complete if its size is the total in "Content-Range: bytes */N".
+                total = r.headers.get("Content-Range", "").rpartition("/")[2]
+                if total.isdigit() and int(total) == existing:
+                    os.replace(part_path, output_path)
+                    logger.info("%s -- already complete, saved.", label)
+                else:
+                    logger.warning("%s -- HTTP 416, discarding stale .part", label)
+                    os.remove(part_path)  # Restart on the next run
+                return
+            else:
+                logger.warning("%s -- HTTP %d", label, r.status_code)
+                return
+
+            if mode is not None:
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+        if mode is None:
+            if restart:
+                os.remove(part_path)  # Re-request the whole tile, once
+                download_tile(session, url, output_path, label)
+            return
+        os.replace(part_path, output_path)
+        logger.info("%s -- saved.", label)
+    except requests.RequestException as exc:
+        logger.error("%s -- failed (partial data kept for resume): %s", label, exc)
+
+
+def download_tiles(output_dir: str, workers: int = MAX_WORKERS) -> None:
+    """Download all ASTER GDEM tiles to the specified directory.
+
+    Tiles are fetched concurrently by a pool of *workers* threads that
+    share one connection pool; the pool size is what keeps the request
+    rate polite towards the server.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    session = make_session(pool_size=max(workers, 1) * 2)
 
     logger.info("Fetching catalog from %s", CATALOG_URL)
-    response = requests.get(CATALOG_URL, timeout=30)
+    response = session.get(CATALOG_URL, timeout=30)
     response.raise_for_status()
 
     catalog = parse_js_catalog(response.text)
@@ -83,6 +171,7 @@ def download_tiles(output_dir: str) -> None:
         tiles = extract_links_regex(response.text)
         logger.info("Catalog parsed via regex: %d tiles found.", len(tiles))
 
+    jobs = []
     for i, item in enumerate(tiles, 1):
         props = item.get("properties", item)
         code = props.get("codigo", f"UNKNOWN_{i}")
@@ -95,22 +184,12 @@ def download_tiles(output_dir: str) -> None:
             logger.info("[%d/%d] %s -- already exists, skipping.", i, len(tiles), code)
             continue
 
-        download_url = gdrive_direct_url(raw_url)
-        logger.info("[%d/%d] Downloading %s ...", i, len(tiles), code)
-
-        try:
-            r = requests.get(download_url, stream=True, timeout=60)
-            if r.status_code == 200:
-                with open(output_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                logger.info("[%d/%d] %s -- saved.", i, len(tiles), code)
-            else:
-                logger.warning("[%d/%d] %s -- HTTP %d", i, len(tiles), code, r.status_code)
-        except requests.RequestException as exc:
-            logger.error("[%d/%d] %s -- failed: %s", i, len(tiles), code, exc)
+        label = f"[{i}/{len(tiles)}] {code}"
+        jobs.append((gdrive_direct_url(raw_url), output_path, label))
 
-        time.sleep(0.5)
+    logger.info("Downloading %d tiles with %d workers ...", len(jobs), workers)
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda job: download_tile(session, *job), jobs))
 
     logger.info("Download complete. Tiles saved to %s", output_dir)
 
@@ -118,8 +197,10 @@ def download_tiles(output_dir: str) -> None:
 def main():
     parser = argparse.ArgumentParser(description="Download ASTER GDEM v3 tiles for Peru.")
     parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Output directory.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Number of concurrent downloads.")
     args = parser.parse_args()
-    download_tiles(args.output_dir)
+    download_tiles(args.output_dir, args.workers)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
 """Extract DEM tiles from zip archives and merge into a single raster.
 
 This script handles the full pipeline from compressed archives to a
-unified DEM: extract *_dem.tif from each .zip, build a virtual mosaic,
-and warp to the project CRS (ESRI:102033) at 30m resolution.
+unified DEM: read *_dem.tif straight from each .zip (GDAL /vsizip/, no
+extraction to disk), build a virtual mosaic, and warp to the project CRS
+(ESRI:102033) at 30m resolution.
 
 Input:  data/raw/dem_tiles/*.zip
 Output: data/processed/rasters/dem.tif
@@ -17,7 +18,7 @@ import glob
 import zipfile
 import argparse
 import logging
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 from osgeo import gdal
 
@@ -39,55 +40,84 @@ GTIFF_OPTIONS = [
     "PREDICTOR=2",
 ]
 
+# NUM_THREADS in GTIFF_OPTIONS only parallelises compression of the output;
+# the warp kernel itself needs its own thread setting.
+WARP_OPTIONS = ["NUM_THREADS=ALL_CPUS"]
 
-def extract_dem_tiles(input_dir: str, temp_dir: str) -> list[str]:
-    """Extract *_dem.tif files from zip archives.
+# Set before any dataset is opened: a larger block cache, and per-thread VRT
+# source handles so warp workers do not serialise on a shared dataset lock.
+GDAL_CONFIG = {
+    "GDAL_CACHEMAX": "4096",
+    "VRT_SHARED_SOURCE": "NO",
+    "GDAL_NUM_THREADS": "ALL_CPUS",
+}
+
+LIST_WORKERS = 8  # Threads reading zip central directories
+
+
+def list_zip_members(zip_path: str) -> list[str]:
+    """Return the *_dem.tif members of one archive as /vsizip/ paths."""
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            names = zf.namelist()
+    except (zipfile.BadZipFile, OSError) as exc:
+        logger.warning("Skipping corrupt archive %s: %s", zip_path, exc)
+        return []
+    zip_path = os.path.abspath(zip_path)
+    return [f"/vsizip/{zip_path}/{name}" for name in names if name.endswith("dem.tif")]
+
+
+def find_dem_tiles(input_dir: str, workers: int = LIST_WORKERS) -> list[str]:
+    """List *_dem.tif files inside the zip archives as /vsizip/ paths.
 
     Filters out auxiliary files (*_num.tif, PDFs) to keep only elevation data.
+    GDAL reads the tiles from inside the archives, so nothing is extracted
+    and no temporary directory is needed. Only the central directories are
+    read here, in parallel.
     """
-    os.makedirs(temp_dir, exist_ok=True)
     zip_pattern = os.path.join(input_dir, "**", "*.zip")
     zip_files = glob.glob(zip_pattern, recursive=True)
     logger.info("Found %d zip archives.", len(zip_files))
 
-    extracted = []
-    for i, zip_path in enumerate(zip_files, 1):
-        try:
-            with zipfile.ZipFile(zip_path, "r") as zf:
-                for name in zf.namelist():
-                    if name.endswith("dem.tif"):
-                        zf.extract(name, temp_dir)
-                        extracted.append(os.path.join(temp_dir, name))
-        except (zipfile.BadZipFile, OSError) as exc:
-            logger.warning("Skipping corrupt archive [%d]: %s", i, exc)
+    tiles = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for members in pool.map(list_zip_members, zip_files):
+            tiles.extend(members)
 
-    logger.info("Extracted %d DEM tiles.", len(extracted))
-    return extracted
+    logger.info("Found %d DEM tiles.", len(tiles))
+    return tiles
 
 
-def build_mosaic_and_warp(tiles: list[str], output_path: str, temp_dir: str) -> None:
-    """Build VRT mosaic and warp to target CRS."""
+def build_mosaic_and_warp(tiles: list[str], output_path: str) -> None:
+    """Build VRT mosaic (in memory) and warp to target CRS."""
     if not tiles:
         raise ValueError("No tiles provided for mosaic.")
 
-    vrt_path = os.path.join(temp_dir, "mosaic.vrt")
+    for key, value in GDAL_CONFIG.items():
+        gdal.SetConfigOption(key, value)
+
+    vrt_path = "/vsimem/mosaic.vrt"
     logger.info("Building VRT mosaic from %d tiles ...", len(tiles))
     gdal.BuildVRT(vrt_path, tiles, options=gdal.BuildVRTOptions(
-        resampleAlg="cubic", srcNodata=None,
+        resampleAlg="nearest", srcNodata=None,
     ))
 
     logger.info("Warping to %s at %dm resolution ...", TARGET_CRS, PIXEL_SIZE)
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    gdal.Warp(output_path, vrt_path, options=gdal.WarpOptions(
-        format="GTiff",
-        dstSRS=TARGET_CRS,
-        xRes=PIXEL_SIZE,
-        yRes=PIXEL_SIZE,
-        resampleAlg="bilinear",
-        dstNodata=-9999,
-        creationOptions=GTIFF_OPTIONS,
-    ))
-
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        gdal.Warp(output_path, vrt_path, options=gdal.WarpOptions(
+            format="GTiff",
+            dstSRS=TARGET_CRS,
+            xRes=PIXEL_SIZE,
+            yRes=PIXEL_SIZE,
+            resampleAlg="bilinear",
+            dstNodata=-9999,
+            multithread=True,
+            warpOptions=WARP_OPTIONS,
+            creationOptions=GTIFF_OPTIONS,
+        ))
+    finally:
+        gdal.Unlink(vrt_path)  # free the in-memory VRT even if the warp fails
     logger.info("DEM saved: %s", output_path)
 
 
@@ -97,15 +127,8 @@ def main():
     parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Output DEM path.")
     args = parser.parse_args()
 
-    temp_dir = os.path.join(args.input_dir, "_temp_extracted")
-
-    try:
-        tiles = extract_dem_tiles(args.input_dir, temp_dir)
-        build_mosaic_and_warp(tiles, args.output, temp_dir)
-    finally:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            logger.info("Temporary files cleaned.")
+    tiles = find_dem_tiles(args.input_dir)
+    build_mosaic_and_warp(tiles, args.output)
 
 
 if __name__ == "__main__":
@@ -13,12 +13,14 @@ Usage:
 """
 
 import os
-import glob
 import argparse
 import logging
 
 from osgeo import gdal
 
+# Warp threading and GDAL config are shared with the zip-based pipeline.
+from merge_and_reproject_dem import GDAL_CONFIG, WARP_OPTIONS
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
@@ -38,10 +40,34 @@ GTIFF_OPTIONS = [
 ]
 
 
+def find_dem_tiles(input_dir: str) -> list[str]:
+    """Recursively list *dem.tif files under *input_dir*.
+
+    Uses os.scandir so file/dir checks come from the directory entries
+    themselves, avoiding an extra stat() per match. Hidden files and
+    directories are skipped, as glob("**/*dem.tif") did (macOS ``._*``
+    resource forks, ``.git``).
+    """
+    tiles = []
+    pending = [input_dir]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.is_file() and entry.name.endswith("dem.tif"):
+                    tiles.append(entry.path)
+    return sorted(tiles)
+
+
 def merge_and_reproject(input_dir: str, output_path: str) -> None:
     """Build VRT mosaic from DEM tiles and warp to target CRS."""
-    pattern = os.path.join(input_dir, "**", "*dem.tif")
-    tiles = [f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f)]
+    for key, value in GDAL_CONFIG.items():
+        gdal.SetConfigOption(key, value)
+
+    tiles = find_dem_tiles(input_dir)
 
     if not tiles:
         raise FileNotFoundError(f"No *dem.tif files found in {input_dir}")
@@ -51,7 +77,7 @@ def merge_and_reproject(input_dir: str, output_path: str) -> None:
     # Step 1: Virtual mosaic
     vrt_path = output_path.replace(".tif", "_temp.vrt")
     logger.info("Building VRT mosaic ...")
-    vrt_opts = gdal.BuildVRTOptions(resampleAlg="cubic", srcNodata=None)
+    vrt_opts = gdal.BuildVRTOptions(resampleAlg="nearest", srcNodata=None)
     gdal.BuildVRT(vrt_path, tiles, options=vrt_opts)
 
     # Step 2: Warp to target CRS and resolution
@@ -63,6 +89,8 @@ def merge_and_reproject(input_dir: str, output_path: str) -> None:
         yRes=PIXEL_SIZE,
         resampleAlg="bilinear",
         dstNodata=-9999,
+        multithread=True,
+        warpOptions=WARP_OPTIONS,
         creationOptions=GTIFF_OPTIONS,
     )
 
@@ -14,6 +14,7 @@ import sys
 import argparse
 import subprocess
 import logging
+import functools
 
 import whitebox
 
@@ -23,8 +24,9 @@ logger = logging.getLogger(__name__)
 DEFAULT_KEYWORDS = ["Vertices", "Points", "Nodes", "Convert", "Slope", "TRI"]
 
 
+@functools.lru_cache(maxsize=1)
 def find_whitebox_binary() -> str:
-    """Locate the WhiteboxTools executable."""
+    """Locate the WhiteboxTools executable (resolved once per process)."""
     module_dir = os.path.dirname(whitebox.__file__)
     candidates = [
         os.path.join(module_dir, "WBT", "whitebox_tools"),
@@ -34,7 +36,8 @@ def find_whitebox_binary() -> str:
         if os.path.exists(path):
             if sys.platform != "win32":
                 try:
-                    os.chmod(path, 0o755)
+                    if not os.stat(path).st_mode & 0o111:
+                        os.chmod(path, 0o755)
                 except OSError:
                     pass
             return path
@@ -42,13 +45,17 @@ def find_whitebox_binary() -> str:
 
 
 def list_tools(executable: str, keywords: list[str]) -> None:
-    """Search installed WhiteboxTools for matching tool names."""
-    for keyword in keywords:
-        logger.info("Searching tools matching '%s' ...", keyword)
-        try:
-            subprocess.run([executable, "--listtools", keyword], check=False)
-        except OSError as exc:
-            logger.error("Failed to query tools: %s", exc)
+    """Search installed WhiteboxTools for matching tool names.
+
+    All keywords go to a single ``--listtools`` call (a tool matches if
+    any keyword does), so the binary is launched once instead of once
+    per keyword.
+    """
+    logger.info("Searching tools matching %s ...", ", ".join(f"'{k}'" for k in keywords))
+    try:
+        subprocess.run([executable, "--listtools", *keywords], check=False)
+    except OSError as exc:
+        logger.error("Failed to query tools: %s", exc)
 
 
 def main():
@@ -7,43 +7,237 @@ processing.
 Usage:
     python inspect_shapefile.py /path/to/file.shp
     python inspect_shapefile.py /path/to/layer.gpkg
+    python inspect_shapefile.py /path/to/layer.gpkg --schema-only
+    python inspect_shapefile.py /path/to/file.shp --no-cache
+    python inspect_shapefile.py /path/to/layer.gpkg --rows 20 --spread
 """
 
 import argparse
+import importlib.util
+import json
 import logging
+import os
 
-import geopandas as gpd
+# geopandas/pandas/pyogrio are imported inside summarise(): loading them
+# (GDAL, GEOS, PROJ) takes seconds, and --help or a cache hit needs none.
+# Only check here which readers are installed.
+HAS_PYOGRIO = importlib.util.find_spec("pyogrio") is not None  # default in geopandas >= 1.0
+READ_ENGINE = "pyogrio" if HAS_PYOGRIO else "fiona"
+USE_ARROW = HAS_PYOGRIO and importlib.util.find_spec("pyarrow") is not None  # columnar reads
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+CACHE_SUFFIX = ".inspect.json"
+CACHE_VERSION = 2  # bump when the summary layout changes
 
-def inspect(filepath: str, n_rows: int = 5) -> None:
-    """Read a vector file and print diagnostic information."""
+
+def _cache_path(filepath: str) -> str:
+    return filepath + CACHE_SUFFIX
+
+
+def _cache_key(filepath: str, n_rows: int, schema_only: bool, spread: bool) -> list:
+    """Identify a report by its files' sizes and mtimes and the options that shape it.
+
+    Every file sharing the dataset's stem is included (.dbf/.shx/.prj/.cpg
+    for a Shapefile, -wal for a GeoPackage): attribute or CRS edits do not
+    touch the main file. mtimes are in nanoseconds so a rewrite within the
+    same second is still seen.
+    """
+    directory = os.path.dirname(filepath) or "."
+    prefix = os.path.splitext(os.path.basename(filepath))[0] + "."
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (entry.name.startswith(prefix) and not entry.name.endswith(CACHE_SUFFIX)
+                    and entry.is_file()):
+                stat = entry.stat()
+                files.append([entry.name, stat.st_size, stat.st_mtime_ns])
+    return [CACHE_VERSION, sorted(files), n_rows, schema_only, spread]
+
+
+def _load_cached(filepath: str, key: list) -> dict | None:
+    try:
+        with open(_cache_path(filepath)) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached["summary"] if cached.get("key") == key else None
+
+
+def _save_cached(filepath: str, key: list, summary: dict) -> None:
+    try:
+        with open(_cache_path(filepath), "w") as f:
+            json.dump({"key": key, "summary": summary}, f, indent=2)
+    except OSError as e:
+        logger.warning("Could not write cache %s: %s", _cache_path(filepath), e)
+
+
+def _read_spread_sample(filepath: str, n_rows: int, n_features: int, **kwargs):
+    """Read *n_rows* features evenly spaced through the layer.
+
+    Each row is a separate ``skip_features`` read, which GDAL serves by
+    seeking (Shapefile .shx offsets, GeoPackage rowid order) rather than
+    decoding the skipped features. The index holds the feature positions.
+    """
+    import pandas as pd
+    import pyogrio
+
+    step = (n_features - 1) / max(n_rows - 1, 1)
+    frames = []
+    for position in sorted({round(i * step) for i in range(n_rows)}):
+        frame = pyogrio.read_dataframe(filepath, skip_features=position, max_features=1, **kwargs)
+        frame.index = [position]
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+def _any_z(geometry) -> bool:
+    """Whether any geometry in the GeoSeries *geometry* has Z coordinates."""
+    try:
+        import shapely
+
+        return bool(shapely.has_z(geometry.to_numpy()).any())  # one C loop (shapely >= 2.0)
+    except AttributeError:
+        return bool(geometry.has_z.any())
+
+
+def summarise(filepath: str, n_rows: int = 5, schema_only: bool = False,
+              spread: bool = False) -> dict:
+    """Read a vector file and return its diagnostic summary as plain values.
+
+    With pyogrio, the summary comes from the layer metadata
+    (``read_info``) and only *n_rows* features are materialised, so the
+    cost does not grow with the size of the file. Without it, the whole
+    file is read.
+
+    With *schema_only* the sample is read without geometries
+    (``read_geometry=False``), so no WKB is decoded at all. For
+    Shapefile (.shx index) and GeoPackage (SQLite metadata) the whole
+    call is then O(1) in the number of features. Requires pyogrio.
+
+    If pyarrow is installed, the sample comes through GDAL's Arrow stream
+    as column batches rather than being built feature by feature.
+
+    With *spread*, the sample rows are spaced evenly across the layer
+    instead of being the first *n_rows*, which helps on files sorted by
+    source or date. Requires pyogrio.
+    """
+    import pandas as pd
+
+    if HAS_PYOGRIO:
+        import pyogrio
+
+        # Bounds come from the layer extent (Shapefile header, GPKG rtree)
+        # without decoding geometries; in schema-only mode a driver that
+        # would need a full scan to compute them reports none instead.
+        info = pyogrio.read_info(filepath, force_feature_count=True,
+                                 force_total_bounds=not schema_only)
+        n_features = info["features"]
+        read_kwargs = {"read_geometry": not schema_only, "use_arrow": USE_ARROW}
+        if spread and n_features > n_rows:
+            sample = _read_spread_sample(filepath, n_rows, n_features, **read_kwargs)
+        else:
+            sample = pyogrio.read_dataframe(filepath, max_features=n_rows, **read_kwargs)
+        columns = list(info["fields"]) + ["geometry"]
+        crs = info["crs"]
+        geom_types = [info["geometry_type"]]
+        # The declared layer type settles it when it says Z; generic types
+        # ("Unknown", "Geometry") do not, so check the sample geometries.
+        has_z = " Z" in str(info["geometry_type"])
+        if not has_z and not schema_only and len(sample):
+            has_z = _any_z(sample.geometry)
+        bounds = info["total_bounds"]
+    else:
+        import geopandas as gpd
+
+        gdf = gpd.read_file(filepath, engine=READ_ENGINE)
+        sample = gdf.head(n_rows)
+        n_features = len(gdf)
+        columns = gdf.columns.tolist()
+        crs = gdf.crs
+        geom_types = gdf.geom_type.unique().tolist()
+        has_z = _any_z(gdf.geometry)
+        bounds = gdf.total_bounds
+
+    # One vectorised pass per statistic across all attribute columns.
+    attrs = sample.drop(columns="geometry", errors="ignore")
+    column_stats = pd.concat(
+        [sample.dtypes,
+         attrs.isna().sum().astype("Int64"),
+         attrs.nunique(dropna=True).astype("Int64")],
+        axis=1, keys=["dtype", "nulls", "nunique"],
+    )
+
+    return {
+        "rows": int(n_features),
+        "columns": columns,
+        "crs": str(crs),
+        "geom_types": [str(g) for g in geom_types],
+        "has_z": bool(has_z),
+        "bounds": None if bounds is None else [float(b) for b in bounds],
+        "sample": sample.to_string(),
+        "column_stats": column_stats.to_string(),
+    }
+
+
+def inspect(filepath: str, n_rows: int = 5, schema_only: bool = False,
+            use_cache: bool = True, spread: bool = False) -> None:
+    """Print diagnostic information for a vector file.
+
+    The summary is cached next to the file (``<filepath>.inspect.json``)
+    and reused while the file's size and mtime are unchanged, so
+    repeated runs on the same layer cost one ``stat``.
+    """
     logger.info("Reading: %s", filepath)
-    gdf = gpd.read_file(filepath)
+    if (schema_only or spread) and not HAS_PYOGRIO:
+        logger.error("--schema-only and --spread require pyogrio.")
+        return
+
+    key = _cache_key(filepath, n_rows, schema_only, spread)
+    summary = _load_cached(filepath, key) if use_cache else None
+    if summary is not None:
+        logger.info("Using cached summary: %s", _cache_path(filepath))
+    else:
+        summary = summarise(filepath, n_rows, schema_only, spread)
+        if use_cache:
+            _save_cached(filepath, key, summary)
 
     print(f"\n{'=' * 60}")
     print(f"FILE: {filepath}")
     print(f"{'=' * 60}")
-    print(f"Rows:          {len(gdf)}")
-    print(f"Columns:       {gdf.columns.tolist()}")
-    print(f"CRS:           {gdf.crs}")
-    print(f"Geometry type: {gdf.geom_type.unique().tolist()}")
-    print(f"Has Z coords:  {gdf.has_z.any()}")
-    print(f"Bounds:        {gdf.total_bounds}")
+    print(f"Rows:          {summary['rows']}")
+    print(f"Columns:       {summary['columns']}")
+    print(f"CRS:           {summary['crs']}")
+    print(f"Geometry type: {summary['geom_types']}")
+    print(f"Has Z coords:  {summary['has_z']}")
+    print(f"Bounds:        {summary['bounds']}")
     print(f"\n--- Sample ({n_rows} rows) ---")
-    print(gdf.head(n_rows))
-    print(f"\n--- Dtypes ---")
-    print(gdf.dtypes)
+    print(summary["sample"])
+    print(f"\n--- Column stats (over sample) ---")
+    print(summary["column_stats"])
+
+
+def _positive_int(value: str) -> int:
+    n = int(value)
+    if n <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return n
 
 
 def main():
     parser = argparse.ArgumentParser(description="Inspect a vector geospatial file.")
     parser.add_argument("filepath", help="Path to the vector file (.shp, .gpkg, .geojson).")
-    parser.add_argument("--rows", type=int, default=5, help="Number of sample rows to display.")
+    parser.add_argument("--rows", type=_positive_int, default=5, help="Number of sample rows to display.")
+    parser.add_argument("--schema-only", action="store_true",
+                        help="Skip geometry decoding; print attributes and metadata only.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore and do not write the <file>.inspect.json summary cache.")
+    parser.add_argument("--spread", action="store_true",
+                        help="Sample rows evenly spaced through the file instead of the first N.")
     args = parser.parse_args()
-    inspect(args.filepath, args.rows)
+    inspect(args.filepath, args.rows, args.schema_only, use_cache=not args.no_cache,
+            spread=args.spread)
 
 
 if __name__ == "__main__":
@@ -4,12 +4,31 @@ Reads the unified DEM from data/processed/rasters/dem.tif using GDAL
 with a downsampling strategy to avoid memory overflow, and saves a
 terrain-colored preview image.
 
+The preview is read from the DEM's overview pyramid. If the raster has
+none, external overviews (dem.tif.ovr) are built once on first run, so
+later previews only decode the reduced-resolution level. When an
+overview is less than twice the requested preview size, the preview
+takes that overview's size, so its pixels are copied without any
+resampling. With the default factor of 20 this is the 1/16 level.
+
 Output:
     outputs/figures/dem_preview.png
 
+With ``--raw`` the colour indices are written straight to a paletted
+PNG (one pixel per preview cell, nodata transparent) without building a
+matplotlib figure; the annotated figure with colorbar and title is meant
+for reports.
+
+When the level still has to be reduced, it is averaged down by default.
+``--fast`` uses nearest-neighbour decimation instead: GDAL then only
+decodes the sampled rows and skips the averaging pass, at the cost of a
+noisier image. That is fine for a quick look, but not for figures.
+
 Usage:
     python visualize_dem.py
     python visualize_dem.py --input /path/to/dem.tif
+    python visualize_dem.py --raw
+    python visualize_dem.py --fast
 """
 
 import os
@@ -17,21 +36,123 @@ import argparse
 import logging
 
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
 from osgeo import gdal
+from PIL import Image
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Skip the directory listing on open. "TRUE" (not "EMPTY_DIR") still lets
+# GDAL probe for the external dem.tif.ovr used for the preview.
+# GDAL_NUM_THREADS parallelises DEFLATE/LZW block decoding. Values already
+# set in the environment take precedence.
+GDAL_CONFIG = {
+    "GDAL_CACHEMAX": "2048",
+    "GDAL_DISABLE_READDIR_ON_OPEN": "TRUE",
+    "GDAL_NUM_THREADS": "ALL_CPUS",
+}
+for _key, _value in GDAL_CONFIG.items():
+    if gdal.GetConfigOption(_key) is None:
+        gdal.SetConfigOption(_key, _value)
+
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 DEFAULT_INPUT = os.path.join(PROJECT_ROOT, "data", "processed", "rasters", "dem.tif")
 DEFAULT_OUTPUT = os.path.join(PROJECT_ROOT, "outputs", "figures", "dem_preview.png")
 
 DOWNSAMPLE_FACTOR = 20  # Read 1 out of every N pixels to reduce memory usage
-
-
-def visualize_dem(input_path: str, output_path: str, downsample: int = DOWNSAMPLE_FACTOR) -> None:
-    """Render a downsampled DEM preview with terrain colormap."""
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+PREVIEW_LEVELS = 255  # colour indices 0-254; 255 marks nodata
+NODATA_INDEX = 255
+PNG_COMPRESS_LEVEL = 1  # zlib level; the preview is write-once, favour speed
+STRIP_ROWS = 1024  # source rows decoded per read, rounded up to whole blocks
+
+
+def select_overview(band: gdal.Band, width: int) -> gdal.Band:
+    """Return the coarsest overview of *band* that is still at least *width* wide.
+
+    Falls back to the full-resolution band when no overview qualifies.
+    """
+    best = band
+    for i in range(band.GetOverviewCount()):
+        overview = band.GetOverview(i)
+        if width <= overview.XSize < best.XSize:
+            best = overview
+    return best
+
+
+def read_downsampled(band: gdal.Band, width: int, height: int,
+                     strip_rows: int = STRIP_ROWS,
+                     resample_alg: int = gdal.GRIORA_Average) -> np.ndarray:
+    """Read *band* resampled to *width* x *height*, one strip of blocks at a time.
+
+    Each call to ``ReadAsArray`` covers about *strip_rows* source rows,
+    rounded to whole TIFF blocks, and is resampled directly into its
+    slice of the float32 output with *resample_alg*. The full-resolution
+    data is never buffered at once, which matters when no overview is
+    small enough.
+    """
+    out = np.empty((height, width), dtype=np.float32)
+    block_h = band.GetBlockSize()[1]
+    src_rows = block_h * max(1, -(-strip_rows // block_h))
+    out_rows = max(1, src_rows * height // band.YSize)
+    for oy in range(0, height, out_rows):
+        oh = min(out_rows, height - oy)
+        y0 = oy * band.YSize // height
+        y1 = (oy + oh) * band.YSize // height
+        band.ReadAsArray(0, y0, band.XSize, y1 - y0, buf_xsize=width, buf_ysize=oh,
+                         buf_type=gdal.GDT_Float32, buf_obj=out[oy:oy + oh],
+                         resample_alg=resample_alg)
+    return out
+
+
+def quantize_preview(data: np.ndarray) -> tuple[np.ndarray, float, float]:
+    """Scale elevations to uint8 colour indices with a 2-98 % percentile stretch.
+
+    matplotlib only needs an index into the colormap, so handing it a
+    uint8 array instead of float32 cuts the rendered buffer by 4x. NaN
+    pixels get ``NODATA_INDEX``.
+
+    Returns
+    -------
+    tuple
+        ``(indices, lo, hi)``, where ``lo``/``hi`` are the elevations mapped
+        to the first and last colour (used to label the colorbar).
+    """
+    valid = ~np.isnan(data)
+    idx = np.full(data.shape, NODATA_INDEX, dtype=np.uint8)
+    if not valid.any():
+        return idx, 0.0, 1.0
+    values = data[valid]
+    lo, hi = (float(v) for v in np.percentile(values, [2, 98]))
+    scale = (PREVIEW_LEVELS - 1) / max(hi - lo, 1e-6)
+    idx[valid] = np.clip((values - lo) * scale, 0, PREVIEW_LEVELS - 1)
+    return idx, lo, hi
+
+
+def save_raw_preview(idx: np.ndarray, cmap: matplotlib.colors.Colormap, output_path: str) -> None:
+    """Write colour indices as a paletted PNG, bypassing the figure pipeline.
+
+    The palette holds the *cmap* colours and ``NODATA_INDEX`` is flagged
+    as the transparent entry, so the image is encoded from *idx* as is.
+    """
+    palette = (cmap(np.arange(PREVIEW_LEVELS))[:, :3] * 255).astype(np.uint8)
+    image = Image.fromarray(idx, mode="P")
+    image.putpalette(palette.tobytes() + bytes(3))  # entry 255: nodata
+    image.save(output_path, transparency=NODATA_INDEX, compress_level=PNG_COMPRESS_LEVEL)
+
+
+def visualize_dem(input_path: str, output_path: str, downsample: int = DOWNSAMPLE_FACTOR,
+                  raw: bool = False, fast: bool = False) -> None:
+    """Render a downsampled DEM preview with terrain colormap.
+
+    With *raw*, the preview is saved as a bare paletted PNG instead of an
+    annotated matplotlib figure. With *fast*, the preview is decimated
+    with nearest neighbour instead of averaged.
+    """
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"DEM not found: {input_path}")
 
@@ -44,36 +165,67 @@ def visualize_dem(input_path: str, output_path: str, downsample: int = DOWNSAMPL
     cols, rows = ds.RasterXSize, ds.RasterYSize
     logger.info("DEM dimensions: %d x %d pixels", cols, rows)
 
+    if band.GetOverviewCount() == 0:
+        logger.info("No overviews found; building %s (one-time) ...", OVERVIEW_LEVELS)
+        ds.BuildOverviews("AVERAGE", OVERVIEW_LEVELS)
+        band = ds.GetRasterBand(1)
+
     preview_w = cols // downsample
     preview_h = rows // downsample
     logger.info("Generating preview at %d x %d (1/%d scale) ...", preview_w, preview_h, downsample)
 
-    data = band.ReadAsArray(buf_xsize=preview_w, buf_ysize=preview_h)
+    source = select_overview(band, preview_w)
+    if source is not band and source.XSize < 2 * preview_w:
+        preview_w, preview_h = source.XSize, source.YSize
+        logger.info("Reading %d x %d overview as is (no resampling).", preview_w, preview_h)
+    else:
+        logger.info("Resampling from %d x %d level.", source.XSize, source.YSize)
+    resample_alg = gdal.GRIORA_NearestNeighbour if fast else gdal.GRIORA_Average
+    data = read_downsampled(source, preview_w, preview_h, resample_alg=resample_alg)
+    # NaN instead of a MaskedArray: matplotlib draws NaN as the "bad" colour
+    # (transparent) without allocating and rescanning a separate mask.
     if nodata is not None:
-        data = np.ma.masked_equal(data, nodata)
+        data[data == nodata] = np.nan
+    idx, lo, hi = quantize_preview(data)
+    # Only the uint8 indices are rendered: drop the float32 preview and
+    # close the DEM (releasing its cached blocks) before matplotlib allocates.
+    del data, source, band
+    ds = None
+
+    cmap = matplotlib.colormaps["terrain"].resampled(PREVIEW_LEVELS)
+    cmap.set_over((0, 0, 0, 0))  # NODATA_INDEX is drawn transparent
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if raw:
+        save_raw_preview(idx, cmap, output_path)
+        logger.info("Preview saved: %s", output_path)
+        return
 
     fig, ax = plt.subplots(figsize=(12, 10))
-    img = ax.imshow(data, cmap="terrain")
-    fig.colorbar(img, ax=ax, label="Elevation (m.a.s.l.)", shrink=0.8)
+    ax.imshow(idx, cmap=cmap, vmin=0, vmax=PREVIEW_LEVELS - 1, interpolation="nearest")
+    fig.colorbar(ScalarMappable(norm=Normalize(lo, hi), cmap=cmap), ax=ax,
+                 label="Elevation (m.a.s.l.)", shrink=0.8)
     ax.set_title(f"Digital Elevation Model — Peru (ESRI:102033, 30m)\n"
-                 f"Preview at {100 / downsample:.0f}% resolution")
+                 f"Preview at {100 * preview_w / cols:.0f}% resolution")
     ax.set_xlabel("X (projected)")
     ax.set_ylabel("Y (projected)")
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    fig.savefig(output_path, dpi=150, bbox_inches="tight")
+    fig.savefig(output_path, dpi=150, bbox_inches="tight",
+                pil_kwargs={"compress_level": PNG_COMPRESS_LEVEL})
     logger.info("Preview saved: %s", output_path)
     plt.close(fig)
 
-    ds = None
-
 
 def main():
     parser = argparse.ArgumentParser(description="Generate DEM preview image.")
     parser.add_argument("--input", default=DEFAULT_INPUT, help="Path to DEM raster.")
     parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Output image path.")
+    parser.add_argument("--raw", action="store_true",
+                        help="Write a bare colour-mapped PNG without axes, title or colorbar.")
+    parser.add_argument("--fast", action="store_true",
+                        help="Nearest-neighbour decimation instead of averaging (quick look only).")
     args = parser.parse_args()
-    visualize_dem(args.input, args.output)
+    visualize_dem(args.input, args.output, raw=args.raw, fast=args.fast)
 
 
 if __name__ == "__main__":